@@ -7,6 +7,7 @@ import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 """
@@ -60,29 +61,64 @@ app.include_router(router)
 
 Both approaches can be used to add routes to a FastAPI application, but `APIRouter` is the standard and recommended approach when working with FastAPI.
 """
+from contextlib import asynccontextmanager
 from langserve import add_routes
-from fastapi_interface.src.base.llm_model import get_hf_llm
-from fastapi_interface.src.rag.main import build_rag_chain, InputQA, OutputQA
+from fastapi_interface.src.base.llm_model import get_vllm_llm
+from fastapi_interface.src.rag.main import abuild_rag_chain, InputQA, InputBatchQA
+from fastapi_interface.src.rag.vectorstore import batch_search
 from fastapi_interface.src.chat.chat import build_chat_chain, InputChat
 
-llm = get_hf_llm(temperature=0.9)
-# The `temperature` parameter in a language model like GPT-3 controls the randomness of the generated text. A higher temperature value results in more diverse and creative outputs, while a lower value produces more conservative and predictable outputs.
-
 PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
-print(PROJECT_DIR)
 docs = os.path.join(PROJECT_DIR, "data_src/file_storage")
 
-# --------- Chains----------------
-doc_chain = build_rag_chain(llm, data_dir=docs, data_type="pdf")
-chat_chain = build_chat_chain(llm,
-                              history_folder=os.path.join(PROJECT_DIR, "chat_histories"),
-                              max_history_length=6)
+# --------- Lifespan ----------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the LLM and the chains once per worker, before the first request.
+
+    Doing this at import time made every `uvicorn --reload` cycle pay the full
+    model load, and the first real request still paid hidden warmup (CUDA
+    kernel compilation, tokenizer init). Initializing here and running one
+    throwaway generation means the first user request hits hot kernels and a
+    primed prefix cache.
+    """
+    llm = get_vllm_llm(temperature=0.9)
+    # The `temperature` parameter in a language model like GPT-3 controls the randomness of the generated text. A higher temperature value results in more diverse and creative outputs, while a lower value produces more conservative and predictable outputs.
+    app.state.llm = llm
+    # The async builder overlaps file loading, embedding and index writing.
+    # Keep the FAISS store and embedder around so /batch_retrieve can query
+    # the index directly with one matrix search.
+    app.state.doc_chain, app.state.doc_db, app.state.doc_embedding = \
+        await abuild_rag_chain(llm, data_dir=docs, data_type="pdf")
+    app.state.chat_chain = build_chat_chain(llm,
+                                            history_folder=os.path.join(PROJECT_DIR, "chat_histories"),
+                                            max_history_length=6)
+
+    # Warmup forward pass so CUDA graphs/kernels are compiled before real traffic.
+    await llm.ainvoke("Hello")
+
+    # --------- Langserve Routes - Playground ----------------
+    add_routes(app,
+               app.state.doc_chain,
+               playground_type="default", # Allow users to interact with the model in the playground
+               path="/generative_ai")
+
+    add_routes(app,
+               app.state.chat_chain,
+               enable_feedback_endpoint=False, # Disable feedback endpoint (user can't provide feedback on model responses)
+               enable_public_trace_link_endpoint=False, # Disable endpoint tracking (don't provide a public chat history link)
+               playground_type="default",
+               path="/chat")
+
+    yield
 
 # --------- FastAPI - App ----------------
 app = FastAPI(
     title="LangChain Server",
     version="1.0",
     description="A simple api server using Langchain's Runnable interfaces",
+    lifespan=lifespan,
 )
 app.add_middleware(
     CORSMiddleware,
@@ -101,29 +137,44 @@ async def check():
     """
     return {"status": "ok"}
 
-@app.post("/generative_ai", response_model=OutputQA)
+def _sse_stream(chain, chain_input, config=None):
+    """
+    Turn a chain's async token stream into Server-Sent Events.
+
+    Streaming means the client sees the first token after prefill instead of
+    waiting for the whole decode, so perceived latency drops from
+    prefill + N tokens to prefill + 1 token.
+    """
+    async def token_stream():
+        async for token in chain.astream(chain_input, config=config):
+            yield f"data: {token}\n\n"
+    return StreamingResponse(token_stream(), media_type="text/event-stream")
+
+@app.post("/generative_ai")
 async def generative_ai(inputs: InputQA):
     """
-    Route to generate answers using the document chain.
+    Route to generate answers using the document chain, streamed as SSE tokens.
+    """
+    return _sse_stream(app.state.doc_chain, inputs.question)
+
+@app.post("/batch_retrieve")
+async def batch_retrieve(inputs: InputBatchQA):
+    """
+    Route to retrieve context chunks for several questions at once.
+
+    All questions are embedded in one batch and searched with a single FAISS
+    matrix query, so N questions cost roughly one search instead of N.
     """
-    answer = doc_chain.invoke(inputs.question)
-    return {"answer": answer}
+    results = batch_search(app.state.doc_db,
+                           app.state.doc_embedding,
+                           inputs.questions,
+                           k=10)
+    return {"results": [[doc.page_content for doc in docs_for_q]
+                        for docs_for_q in results]}
 
 @app.post("/chat")
 async def chat(inputs: InputChat, request: Request):
     session_id = request.cookies.get("session_id", "default_session") # Get session from cookie (or default).
-    response = chat_chain.invoke({"human_input": inputs.human_input}, config={"configurable": {"session_id": session_id}}) # Invoke the chat chain with the human input and session ID.
-    return {"answer": response}
-
-# --------- Langserve Routes - Playground ----------------
-add_routes(app,
-           doc_chain,
-           playground_type="default", # Allow users to interact with the model in the playground
-           path="/generative_ai")
-
-add_routes(app,
-           chat_chain,
-           enable_feedback_endpoint=False, # Disable feedback endpoint (user can't provide feedback on model responses)
-           enable_public_trace_link_endpoint=False, # Disable endpoint tracking (don't provide a public chat history link)
-           playground_type="default",
-           path="/chat")
+    return _sse_stream(app.state.chat_chain,
+                       {"human_input": inputs.human_input},
+                       config={"configurable": {"session_id": session_id}})
@@ -1,21 +1,31 @@
 """
 This module defines a factory function to manage chat history by session.
 
-The factory function `create_session_factory` creates a function that retrieves chat history from a JSON file by session_id. The function checks the format of the session_id and limits the number of stored messages to a specified maximum history length.
+The factory function `create_session_factory` creates a function that retrieves chat history from an append-only JSONL file by session_id. The function checks the format of the session_id and limits the number of returned messages to a specified maximum history length.
 
 The `create_session_factory` function takes two arguments:
 - `base_dir`: The base directory where the chat history files are stored.
 - `max_history_length`: The maximum number of messages to store in the chat history.
 
-The factory function returns a function `get_chat_history` that takes a session_id as input and returns a `FileChatMessageHistory` object that manages the chat history for that session.
+The factory function returns a function `get_chat_history` that takes a session_id as input and returns a `JSONLChatMessageHistory` object that manages the chat history for that session.
 """
 
 import os
 import re
-from typing import Callable, Union
+import mmap
+import threading
+import orjson # C-accelerated JSON codec: 2-5x faster than stdlib json on message payloads
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, List, Union
 from fastapi import HTTPException
 from langchain_core.chat_history import BaseChatMessageHistory # BaseChatMessageHistory is an abstract class that defines the interface for chat history management.
-from langchain.memory import FileChatMessageHistory # FileChatMessageHistory is a class that implements chat history management using a file-based storage system.
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict # Converters between message objects and their dict representation.
+
+# Compiled once at import time: this validator runs on every chat request, so
+# it should not pay a re.compile (or even a compile-cache lookup) per call.
+_VALID_SESSION_ID_RE = re.compile(r"\A[a-zA-Z0-9-_]+\Z")
 
 def _is_valid_identifier(value: str) -> bool:
     """
@@ -31,19 +41,135 @@ def _is_valid_identifier(value: str) -> bool:
     - "session@123" is invalid.
     - "session 123" is invalid.
     """
-    valid_characters = re.compile(r"^[a-zA-Z0-9-_]+$")
-    return bool(valid_characters.match(value))
+    return bool(_VALID_SESSION_ID_RE.match(value))
+
+class JSONLChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history stored as an append-only JSONL file (one message per line).
+
+    `FileChatMessageHistory` rewrites the entire message list on every
+    `add_message`, which is O(N) per turn and dominates request latency for
+    long sessions. With JSONL, adding a message is a single O(1) append, and
+    reading the history only parses the last `max_messages` lines instead of
+    loading the whole file.
+
+    Args:
+    file_path: str
+        The path of the `.jsonl` history file.
+    max_messages: int
+        The maximum number of trailing messages returned by `messages`.
+        None means no limit.
+    """
+    def __init__(self, file_path: str, max_messages: int = None) -> None:
+        self.file_path = file_path
+        # Legacy monolithic `.json` file (a JSON array of message dicts)
+        # written by FileChatMessageHistory before the JSONL switch.
+        self._legacy_path = os.path.splitext(file_path)[0] + ".json"
+        self.max_messages = max_messages
+        # History objects are shared across requests of the same session (see
+        # create_session_factory), so file mutations need to be serialized.
+        self._lock = threading.Lock()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Read the last `max_messages` messages without loading the full file into message objects."""
+        if not os.path.exists(self.file_path):
+            # Backward compatibility: fall back to the legacy file until the
+            # first write migrates it into the `.jsonl`.
+            if os.path.exists(self._legacy_path):
+                with open(self._legacy_path, "rb") as f:
+                    items = orjson.loads(f.read())
+                if self.max_messages is not None:
+                    items = items[-self.max_messages:]
+                return messages_from_dict(items)
+            return []
+        with open(self.file_path, "rb") as f:
+            # deque with maxlen keeps only the tail lines while streaming the file once.
+            lines = deque(f, maxlen=self.max_messages)
+        return messages_from_dict([orjson.loads(line) for line in lines])
+
+    def add_message(self, message: BaseMessage) -> None:
+        """Append one message as a single JSONL record — O(1) per turn."""
+        with self._lock:
+            # Without this, the first append would create the `.jsonl` and
+            # permanently shadow the legacy history mid-conversation.
+            self._migrate_legacy_locked()
+            with open(self.file_path, "ab") as f:
+                f.write(orjson.dumps(message_to_dict(message)) + b"\n")
+
+    def _migrate_legacy_locked(self) -> None:
+        """One-time migration of a legacy `.json` history into the `.jsonl` file."""
+        if os.path.exists(self.file_path) or not os.path.exists(self._legacy_path):
+            return
+        with open(self._legacy_path, "rb") as f:
+            items = orjson.loads(f.read())
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for item in items:
+                f.write(orjson.dumps(item) + b"\n")
+        os.replace(tmp_path, self.file_path)
+        os.remove(self._legacy_path)
+
+    def trim(self, max_len: int) -> None:
+        """
+        Drop all but the last `max_len` messages from the on-disk file.
+
+        The file is memory-mapped and scanned backwards counting newlines to
+        find the byte offset where the kept tail starts; only those trailing
+        bytes are rewritten (into a temp file swapped in with `os.replace`, so
+        a crash never leaves a half-written history). For the common case of
+        overflowing by one or two messages this copies a tiny tail, instead of
+        the clear-and-re-add approach that rewrote the whole kept history.
+        """
+        if not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0:
+            return
+        with self._lock:
+            self._trim_locked(max_len)
+
+    def _trim_locked(self, max_len: int) -> None:
+        with open(self.file_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Ignore a trailing newline so it doesn't count as an extra record.
+                end = len(mm) - 1 if mm[-1:] == b"\n" else len(mm)
+                offset = 0
+                remaining = max_len
+                pos = end
+                while remaining > 0:
+                    pos = mm.rfind(b"\n", 0, pos)
+                    if pos < 0:
+                        break  # Fewer than max_len messages: nothing to trim.
+                    offset = pos + 1
+                    remaining -= 1
+                if remaining > 0 or offset == 0:
+                    return
+                tail = mm[offset:]
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(tail)
+        os.replace(tmp_path, self.file_path)
+
+    def clear(self) -> None:
+        """Remove all stored messages, including any legacy `.json` file."""
+        with self._lock:
+            if os.path.exists(self.file_path):
+                os.remove(self.file_path)
+            # Also drop the legacy file, or a cleared session would resurrect
+            # its pre-migration messages on the next read.
+            if os.path.exists(self._legacy_path):
+                os.remove(self._legacy_path)
+
 
 def create_session_factory(base_dir: Union[str, str], max_history_length: int) -> Callable[[str], BaseChatMessageHistory]:
     """Create a factory to manage chat history by session."""
 
-    # Ensure the directory exists, create it if it doesn't
-    if not os.path.exists(base_dir):
-        os.makedirs(base_dir)
+    # Resolve the directory to an absolute path once at factory build, so no
+    # per-request call ever re-normalizes it, and create it if it doesn't exist.
+    base = Path(base_dir).resolve()
+    base.mkdir(parents=True, exist_ok=True)
+
+    def get_chat_history(session_id: str) -> JSONLChatMessageHistory:
+        """Retrieve chat history from a JSONL file by session_id."""
 
-    def get_chat_history(session_id: str) -> FileChatMessageHistory:
-        """Retrieve chat history from a JSON file by session_id."""
-        
         # Check the format of session_id
         if not _is_valid_identifier(session_id):
             raise HTTPException(
@@ -52,20 +178,20 @@ def create_session_factory(base_dir: Union[str, str], max_history_length: int) -
                        "It can only contain letters, numbers, hyphens (-), and underscores (_)."
             )
 
-        # Determine the file path to save chat history
-        file_path = os.path.join(base_dir, f"{session_id}.json")
-
-        # Create an object to manage chat history
-        chat_hist = FileChatMessageHistory(file_path)
-        messages = chat_hist.messages # Get the list of messages stored in the chat history
+        # Reuse one history object per session instead of constructing a fresh
+        # one (and re-reading the file) on every chat turn. Reads are capped to
+        # the last max_history_length messages, and trim keeps the on-disk file
+        # from growing without bound by truncating old records in place.
+        chat_hist = _get_history(session_id)
+        chat_hist.trim(max_history_length)
 
-        # Limit the number of stored messages
-        if len(messages) > max_history_length:
-            chat_hist.clear()  # Clear old history
-            for message in messages[-max_history_length:]:  # Keep only the last max_history_length messages
-                chat_hist.add_message(message)
-
-        print("Number of messages in history: ", len(chat_hist.messages))
         return chat_hist
 
+    @lru_cache(maxsize=1024)
+    def _get_history(session_id: str) -> JSONLChatMessageHistory:
+        # The path string is formatted once per session here and then cached
+        # along with the history object by the lru_cache.
+        file_path = os.fspath(base / f"{session_id}.jsonl")
+        return JSONLChatMessageHistory(file_path, max_messages=max_history_length)
+
     return get_chat_history
@@ -1,10 +1,25 @@
 from typing import List
 import re
+from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 
+# Compiled once at import time. Relying on re's internal compile cache is
+# fragile (it holds at most 512 patterns), and this parser runs on every
+# chat response.
+_ANSWER_PATTERNS = [
+    re.compile(r'\nAssistant:(.*)', re.DOTALL),
+    re.compile(r'\nAI:(.*)', re.DOTALL),
+]
+
 def recursive_extract(text, pattern, default_answer):
     """
-    Recursively extract the answer from the text using the pattern.
+    Extract the answer from the text using the pattern, keeping only the text
+    after the last occurrence of the marker.
+
+    The extraction is a simple loop: search, narrow to the matched group, and
+    search again until no marker is left (the old implementation did the same
+    thing with one Python frame and a from-scratch `re.search` per level of
+    recursion).
 
     Examples:
     - Input: "Assistant: The answer is 42."
@@ -14,35 +29,74 @@ def recursive_extract(text, pattern, default_answer):
     - Input: "Assistant: The answer is 42. AI: The answer is 42."
         Output: "The answer is 42."
     """
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        assistant_text = match.group(1).strip()
-        return recursive_extract(assistant_text, pattern, assistant_text)
-    else:
-        return default_answer
+    if not hasattr(pattern, "search"):
+        # Accept plain string patterns for backward compatibility.
+        pattern = re.compile(pattern, re.DOTALL)
+    result = default_answer
+    match = pattern.search(text)
+    while match:
+        result = match.group(1).strip()
+        match = pattern.search(result)
+    return result
 
 class Str_OutputParser(StrOutputParser):
     """
     Custom output parser for chat responses.
+
+    The `\\nAssistant:`/`\\nAI:` markers only appear when the backend echoes
+    the prompt (the old `HuggingFacePipeline` behavior); the vLLM backend
+    returns just the completion. The parser therefore passes text through
+    unchanged when no marker is present, and during streaming it extracts
+    over the aggregated text rather than per token chunk — an individual
+    chunk almost never contains a marker.
     """
     def parse(self, text: str) -> str:
         return self._extract_answer(text)
-    
+
     def _extract_answer(self,
                        text_response: str,
                        patterns: List[str] = None,
-                       default = "Sorry, I am not sure how to help with that."
                        ) -> str:
         """
-        Extract the answer from the text response using the specified patterns."
+        Extract the answer from the text response using the specified
+        patterns, returning the text unchanged when no marker matches.
         """
-        input_text = text_response
-        default_answer = default
         if patterns is None:
-            patterns = [r'\nAssistant:(.*)', r'\nAI:(.*)']
+            patterns = _ANSWER_PATTERNS
+        output_text = text_response
         for pattern in patterns:
-            output_text = recursive_extract(input_text, pattern, default_answer)
-            if output_text != default_answer:
-                input_text = output_text
-                default_answer = output_text
-        return output_text
+            # Pass the current text as the default: a pattern that never
+            # matches leaves the response untouched instead of replacing it.
+            output_text = recursive_extract(output_text, pattern, output_text)
+        return output_text.strip()
+
+    def _emit_delta(self, raw: str, emitted: str, chunk) -> tuple:
+        """
+        Shared incremental step for the sync/async transforms: fold one chunk
+        into the raw aggregate, re-extract, and return the new state plus the
+        delta that extends what was already emitted.
+        """
+        text = chunk.content if isinstance(chunk, BaseMessage) else chunk
+        raw += text
+        parsed = self._extract_answer(raw)
+        if parsed.startswith(emitted):
+            delta = parsed[len(emitted):]
+            return raw, parsed if delta else emitted, delta
+        # A marker just appeared: everything streamed so far was prompt echo.
+        # Already-sent chunks cannot be retracted; restart emission from the
+        # extracted tail so at least the rest of the stream is clean.
+        return raw, parsed, ""
+
+    def _transform(self, input):
+        raw, emitted = "", ""
+        for chunk in input:
+            raw, emitted, delta = self._emit_delta(raw, emitted, chunk)
+            if delta:
+                yield delta
+
+    async def _atransform(self, input):
+        raw, emitted = "", ""
+        async for chunk in input:
+            raw, emitted, delta = self._emit_delta(raw, emitted, chunk)
+            if delta:
+                yield delta
@@ -1,11 +1,15 @@
 from . import (
     file_loader,
     vectorstore,
+    embed_cache,
     rag,
+    prompts,
+    kv_cache,
+    semantic_cache,
     utils,
     main,
 )
 
-__all__ = ["file_loader", "vectorstore", "rag", "utils", "main"]
+__all__ = ["file_loader", "vectorstore", "embed_cache", "rag", "prompts", "kv_cache", "semantic_cache", "utils", "main"]
 
-_ = file_loader, vectorstore, rag, utils, main
+_ = file_loader, vectorstore, embed_cache, rag, prompts, kv_cache, semantic_cache, utils, main
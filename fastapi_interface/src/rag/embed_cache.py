@@ -0,0 +1,112 @@
+"""
+This module memoizes chunk embeddings across ingests.
+
+Every call to `build_rag_chain` re-embeds the whole corpus, even when nothing
+changed — and embedding is the dominant cost of indexing. The cache stores one
+row per chunk in a sidecar SQLite file, keyed by the SHA-256 of the chunk text,
+so a repeated startup over an unchanged corpus only does O(lookup) work and a
+partially changed corpus only embeds the new chunks (in one batched call).
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, List
+
+import numpy as np
+
+# Sidecar database next to the ingested files: fastapi_interface/data_src/embed_cache.sqlite
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data_src",
+    "embed_cache.sqlite",
+)
+
+
+class EmbeddingCache:
+    """
+    This class is a persistent content-hash cache of chunk embeddings.
+
+    Args:
+    db_path: str
+        The SQLite file the cache is stored in.
+    """
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH) -> None:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # One shared connection, so concurrent callers (the async builder runs
+        # several embed stages in threads) must serialize their statements.
+        self._lock = threading.Lock()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS emb (key TEXT PRIMARY KEY, vec BLOB)")
+        self._conn.commit()
+
+    def put(self, texts: List[str], vectors: List[List[float]]) -> None:
+        """
+        Store already-computed embeddings (e.g. from the parallel-embed path)
+        so later ingests hit the cache for these chunks too.
+        """
+        rows = [
+            (hashlib.sha256(text.encode("utf-8")).hexdigest(),
+             np.asarray(vec, dtype=np.float32).tobytes())
+            for text, vec in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO emb (key, vec) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def lookup(self, texts: List[str]) -> List:
+        """
+        Return the cached vector of every text as a float32 array, aligned
+        with `texts`, with None for misses. Used by callers that fill their
+        own preallocated buffer and only want to embed the misses.
+        """
+        out = []
+        with self._lock:
+            for text in texts:
+                key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                row = self._conn.execute("SELECT vec FROM emb WHERE key = ?", (key,)).fetchone()
+                out.append(np.frombuffer(row[0], dtype=np.float32) if row is not None else None)
+        return out
+
+    def get_or_embed(self,
+                     texts: List[str],
+                     embed_fn: Callable[[List[str]], List[List[float]]]
+                     ) -> List[List[float]]:
+        """
+        Return the embedding of every text, embedding only the cache misses.
+
+        Args:
+        texts: List[str]
+            The chunk texts to embed.
+        embed_fn: Callable
+            The (batched) embedding function used for cache misses.
+
+        Returns:
+        List[List[float]]: The embeddings, aligned with `texts`.
+        """
+        keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        vectors: List = [None] * len(texts)
+        misses = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                row = self._conn.execute("SELECT vec FROM emb WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vectors[i] = np.frombuffer(row[0], dtype=np.float32).tolist()
+                else:
+                    misses.append(i)
+
+        if misses:
+            # One batched call for everything the cache doesn't know yet.
+            # Done outside the lock so concurrent callers can embed in parallel.
+            fresh = embed_fn([texts[i] for i in misses])
+            rows = []
+            for i, vec in zip(misses, fresh):
+                vectors[i] = vec
+                rows.append((keys[i], np.asarray(vec, dtype=np.float32).tobytes()))
+            # Bulk insert in a single transaction instead of a commit per row.
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO emb (key, vec) VALUES (?, ?)", rows)
+                self._conn.commit()
+
+        return vectors
@@ -1,5 +1,5 @@
 from typing import Union, List, Literal
-import glob # This function is used to return all files matching a specified pattern
+import os
 from tqdm import tqdm
 import multiprocessing
 from langchain_community.document_loaders import PyPDFLoader, BSHTMLLoader
@@ -7,9 +7,13 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 def remove_non_utf8_characters(text):
     """
-    This function removes non-utf8 characters from the text.
+    This function removes non-ascii characters (code point >= 128) from the text.
     """
-    return ''.join(char for char in text if ord(char) < 128) # ord() function returns the Unicode code point for the given character
+    # encode/decode with "ignore" drops every non-ascii character in a single
+    # C-level pass. The old per-character generator created one Python string
+    # object per kept character, which is O(N) interpreter work on every page
+    # of every document.
+    return text.encode("ascii", "ignore").decode("ascii")
 
 def load_pdf(pdf_file):
     """
@@ -51,12 +55,15 @@ class PDFLoader(BaseLoader):
     """
     def __call__(self, pdf_files: List[str], **kwargs):
         num_processes = min(self.num_processes, kwargs["workers"])
+        # Hand each worker several files at a time instead of the default
+        # chunksize=1, so small files don't pay one IPC round-trip each.
+        chunksize = max(1, len(pdf_files) // (4 * num_processes))
         with multiprocessing.Pool(processes=num_processes) as pool:
             doc_loaded = []
             total_files = len(pdf_files)
             with tqdm(total=total_files, desc="Loading PDFs", unit="file") as pbar:
                 # imap_unordered() function returns an iterator that returns the results of the function as they complete
-                for result in pool.imap_unordered(load_pdf, pdf_files):
+                for result in pool.imap_unordered(load_pdf, pdf_files, chunksize=chunksize):
                     doc_loaded.extend(result)
                     pbar.update(1)
         return doc_loaded
@@ -67,11 +74,12 @@ class HTMLLoader(BaseLoader):
     """
     def __call__(self, html_files: List[str], **kwargs):
         num_processes = min(self.num_processes, kwargs["workers"])
+        chunksize = max(1, len(html_files) // (4 * num_processes))
         with multiprocessing.Pool(processes=num_processes) as pool:
             doc_loaded = []
             total_files = len(html_files)
             with tqdm(total=total_files, desc="Loading HTMLs", unit="file") as pbar:
-                for result in pool.imap_unordered(load_html, html_files):
+                for result in pool.imap_unordered(load_html, html_files, chunksize=chunksize):
                     doc_loaded.extend(result)
                     pbar.update(1)
         return doc_loaded
@@ -136,7 +144,63 @@ class Loader:
         doc_split = self.doc_splitter(doc_loaded)
         return doc_split
 
-    def load_dir(self, dir_path: str, workers: int = 4):
+    def list_files(self, dir_path: str, recursive: bool = False) -> List[str]:
+        """
+        This function lists the loadable files in the directory.
+        """
+        suffix = ".pdf" if self.file_type == "pdf" else ".html"
+        if recursive:
+            files = [os.path.join(root, name)
+                     for root, _, names in os.walk(dir_path)
+                     for name in names if name.endswith(suffix)]
+        else:
+            # os.scandir reuses the directory entry's inode info, so this does
+            # one stat per entry instead of glob's pattern parse + extra stats.
+            with os.scandir(dir_path) as entries:
+                files = [entry.path for entry in entries
+                         if entry.is_file() and entry.name.endswith(suffix)]
+        assert len(files) > 0, f"No {self.file_type} files found in {dir_path}"
+        return files
+
+    def iter_dir(self,
+                 dir_path: str,
+                 workers: int = 4,
+                 batch_size: int = 128,
+                 recursive: bool = False):
+        """
+        This function yields the split documents in batches instead of
+        returning the whole directory as one list.
+
+        `load_dir` materializes every chunk of every file before the caller
+        sees any of them, so peak memory at index build is O(corpus). Loading
+        `workers` files at a time and yielding `batch_size` chunks keeps peak
+        memory at O(batch) while still feeding the process pool full groups
+        of files.
+
+        Args:
+        dir_path: str
+            The path to the directory containing the files.
+        workers: int
+            The number of workers (and files loaded per group).
+        batch_size: int
+            The number of split documents per yielded batch.
+        recursive: bool
+            Whether to also search subdirectories for files.
+
+        Yields:
+        List[Document]: Batches of the documents with the text split.
+        """
+        files = self.list_files(dir_path, recursive=recursive)
+        pending = []
+        for start in range(0, len(files), workers):
+            pending.extend(self.load(files[start:start + workers], workers=workers))
+            while len(pending) >= batch_size:
+                yield pending[:batch_size]
+                pending = pending[batch_size:]
+        if pending:
+            yield pending
+
+    def load_dir(self, dir_path: str, workers: int = 4, recursive: bool = False):
         """
         This function loads the files in the directory and splits the text.
 
@@ -145,15 +209,11 @@ class Loader:
             The path to the directory containing the files.
         workers: int
             The number of workers to use for loading the files.
+        recursive: bool
+            Whether to also search subdirectories for files.
 
         Returns:
         doc_split: List[Document]
             The list of the documents with the text split.
         """
-        if self.file_type == "pdf":
-            files = glob.glob(f"{dir_path}/*.pdf")
-            assert len(files) > 0, f"No {self.file_type} files found in {dir_path}"
-        else:
-            files = glob.glob(f"{dir_path}/*.html")
-            assert len(files) > 0, f"No {self.file_type} files found in {dir_path}"
-        return self.load(files, workers=workers)
+        return self.load(self.list_files(dir_path, recursive=recursive), workers=workers)
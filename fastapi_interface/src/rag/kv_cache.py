@@ -0,0 +1,185 @@
+"""
+This module precomputes and persists a KV cache for document chunks.
+
+Prefill is the dominant cost of a RAG query: the model recomputes the key/value
+tensors for the same retrieved chunks on every request, even though the chunks
+stored in `VectorDB` never change after ingestion. `KVCacheManager` runs the
+prefill once per chunk at ingestion time (see `build_rag_chain`), over the
+shared instruction prefix plus the chunk, and saves the resulting
+`past_key_values` to disk keyed by the SHA-256 of the chunk text. At query
+time `generate_with_cache` seeds generation with the cached tensors of the
+chunk that opens the prompt, so only the rest of the prompt is prefilled —
+cheap disk reads instead of prefill FLOPs. A small in-RAM LRU sits on top of
+the disk cache so hot chunks do not even pay the disk read.
+
+Note: this path is only used with the Hugging Face backend (`get_hf_llm`),
+where generation can be fed `past_key_values` directly. The vLLM backend
+manages its own KV cache and covers the same reuse via prefix caching.
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional
+
+from fastapi_interface.src.rag.prompts import RAG_PROMPT_TEMPLATE
+
+# The static instruction block that precedes the context in every prompt.
+# past_key_values are positional, so a cache entry is only reusable when it
+# covers a literal prefix of the prompt: prefilling `prefix + chunk` makes the
+# entry of whichever chunk sorts first in the context directly usable.
+_PROMPT_PREFIX = RAG_PROMPT_TEMPLATE.split("{context}")[0]
+
+# torch is imported inside the methods that need it: this module is on the
+# eager import path of the package, and a top-level `import torch` would undo
+# the deferred heavy imports in `vectorstore` (multiple seconds of cold start
+# per worker) even for deployments that never enable the KV cache.
+
+
+def chunk_key(text: str) -> str:
+    """
+    Return the cache key for a chunk: the SHA-256 hex digest of its text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class KVCacheManager:
+    """
+    This class manages the per-chunk KV cache.
+
+    Args:
+    cache_dir: str
+        The directory where the `.pt` cache files are stored.
+    max_ram_entries: int
+        The maximum number of chunks kept in the in-RAM LRU on top of disk.
+    """
+    def __init__(self,
+                 cache_dir: str,
+                 max_ram_entries: int = 64
+                 ) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_ram_entries = max_ram_entries
+        # OrderedDict as LRU: move_to_end on hit, popitem(last=False) on overflow.
+        self._ram_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def path_for(self, text: str) -> str:
+        """
+        Return the on-disk path of the cache entry for a chunk text.
+        """
+        return os.path.join(self.cache_dir, f"{chunk_key(text)}.pt")
+
+    def precompute(self, documents, model, tokenizer) -> int:
+        """
+        Run prefill once for every chunk and persist its `past_key_values`.
+
+        Each entry covers the shared instruction prefix plus the chunk text,
+        so it literally prefixes any prompt whose context opens with that
+        chunk. Chunks whose cache file already exists are skipped, so
+        re-running ingestion on an unchanged corpus does no model work at all.
+
+        Args:
+        documents: List[Document]
+            The split documents returned by `Loader.load_dir`.
+        model: The causal LM used for prefill.
+        tokenizer: The tokenizer matching the model.
+
+        Returns:
+        int: The number of chunks that were actually prefilled.
+        """
+        import torch
+
+        computed = 0
+        for doc in documents:
+            path = self.path_for(doc.page_content)
+            if os.path.exists(path):
+                continue
+            inputs = tokenizer(_PROMPT_PREFIX + doc.page_content, return_tensors="pt").to(model.device)
+            with torch.no_grad():
+                outputs = model(**inputs, use_cache=True)
+            torch.save(outputs.past_key_values, path)
+            # Record the cache path on the document so the vector store keeps it in the chunk metadata.
+            doc.metadata["kv_cache_path"] = path
+            computed += 1
+        return computed
+
+    def load(self, text: str) -> Optional[tuple]:
+        """
+        Load the cached `past_key_values` for a chunk, or None on a miss.
+
+        Hits are served from the in-RAM LRU when possible; disk hits are
+        promoted into the LRU.
+        """
+        import torch
+
+        key = chunk_key(text)
+        if key in self._ram_cache:
+            self._ram_cache.move_to_end(key)
+            return self._ram_cache[key]
+        path = os.path.join(self.cache_dir, f"{key}.pt")
+        if not os.path.exists(path):
+            return None
+        past_key_values = torch.load(path, map_location="cpu")
+        self._ram_cache[key] = past_key_values
+        if len(self._ram_cache) > self.max_ram_entries:
+            self._ram_cache.popitem(last=False)
+        return past_key_values
+
+    def load_for_docs(self, docs) -> List[Optional[tuple]]:
+        """
+        Load the cached `past_key_values` for a list of retrieved documents.
+
+        The result is aligned with `docs`; entries are None for chunks that
+        were never precomputed (e.g. added after the last ingestion).
+        """
+        return [self.load(doc.page_content) for doc in docs]
+
+    def generate_with_cache(self, pipeline, prompt: str, docs, max_new_tokens: int = 256) -> str:
+        """
+        Generate a completion for `prompt`, seeding prefill from the cache.
+
+        The prompt opens with the instruction prefix followed by the first
+        retrieved chunk, which is exactly the span `precompute` prefilled, so
+        that chunk's `past_key_values` can be handed to `generate` and only
+        the remaining tokens are prefilled. Reuse is gated on the prompt
+        tokenizing to the same ids over the cached span (a merge at the
+        boundary would shift every later position); any mismatch — including
+        stale cache files from an older prompt template — falls back to a
+        full prefill.
+
+        Args:
+        pipeline: The Hugging Face pipeline of the backing LLM.
+        prompt: str
+            The fully formatted prompt string.
+        docs: List[Document]
+            The retrieved documents, in the order they appear in the context.
+        max_new_tokens: int
+            The maximum number of tokens to generate.
+
+        Returns:
+        str: The generated completion (without the prompt echo).
+        """
+        import torch
+
+        model, tokenizer = pipeline.model, pipeline.tokenizer
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        gen_kwargs = dict(max_new_tokens=max_new_tokens, pad_token_id=tokenizer.eos_token_id)
+        for doc in docs:
+            cached_text = _PROMPT_PREFIX + doc.page_content
+            if not prompt.startswith(cached_text):
+                break  # Only the chunk that opens the context can match.
+            past = self.load(doc.page_content)
+            if past is None:
+                break
+            prefix_ids = tokenizer(cached_text, return_tensors="pt")["input_ids"][0].to(model.device)
+            cached_len = past[0][0].shape[-2]
+            if (cached_len == prefix_ids.shape[0]
+                    and torch.equal(inputs["input_ids"][0, :cached_len], prefix_ids)):
+                if model.device.type != "cpu":
+                    past = tuple(tuple(t.to(model.device) for t in layer) for layer in past)
+                gen_kwargs["past_key_values"] = past
+            break
+        with torch.no_grad():
+            output_ids = model.generate(**inputs, **gen_kwargs)
+        return tokenizer.decode(output_ids[0, inputs["input_ids"].shape[1]:],
+                                skip_special_tokens=True)
@@ -1,19 +1,197 @@
-from pydantic import BaseModel, Field
-from fastapi_interface.src.rag.file_loader import Loader
-from fastapi_interface.src.rag.vectorstore import VectorDB
+import math
+import asyncio
+from itertools import repeat
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from pydantic import BaseModel, ConfigDict
+from fastapi_interface.src.rag.file_loader import Loader, get_num_cpu
+from fastapi_interface.src.rag.vectorstore import (VectorDB, build_default_embedding,
+                                                  tune_faiss_index, DEFAULT_EMBEDDING_MODEL)
+from fastapi_interface.src.rag.embed_cache import EmbeddingCache
 from fastapi_interface.src.rag.rag import RAG_Chain
+from fastapi_interface.src.rag.kv_cache import KVCacheManager
+from fastapi_interface.src.rag.semantic_cache import SemanticCache, CachedChain
+
+# Plain annotations instead of `Field(..., title=...)`: these models are
+# validated on every request, and the bare annotation skips the per-field
+# metadata lookup that `Field` adds. frozen=True also lets pydantic build
+# an immutable, hashable instance without change-tracking hooks.
 
 class InputQA(BaseModel):
     """Input data model for the question answering API"""
-    question: str = Field(..., title="Question to ask the model")
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=False)
+    question: str
 
 class OutputQA(BaseModel):
     """Output data model for the question answering API"""
-    answer: str = Field(..., title="Answer from the model")
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=False)
+    answer: str
+
+class InputBatchQA(BaseModel):
+    """Input data model for the batched retrieval API"""
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=False)
+    questions: List[str]
+
+def _embed_shard(texts, model_name=DEFAULT_EMBEDDING_MODEL):
+    """
+    Process-pool worker: embed one shard of chunk texts.
+
+    Each worker builds its own embedder instead of receiving one over pickle,
+    so the model weights are never serialized across the process boundary.
+    The model and normalization must match `build_default_embedding` — the
+    vectors land in the same FAISS index (and content-hash cache) that the
+    query-time embedder is used against.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name,
+                                 encode_kwargs={"normalize_embeddings": True}).embed_documents(texts)
+
+def _parallel_embed(texts, n_workers=None, model_name=DEFAULT_EMBEDDING_MODEL):
+    """
+    Embed texts across a process pool, one shard per CPU.
+
+    Thread pools don't help here: the Python-side pre/post-processing of the
+    sentence-transformer forward pass holds the GIL, so CPU-bound embedding
+    only scales with separate processes. Shard order is preserved so the
+    concatenated result aligns with `texts`.
+    """
+    n_workers = n_workers or get_num_cpu()
+    shard_size = math.ceil(len(texts) / n_workers)
+    shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+    embeddings = []
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        for shard_embeddings in pool.map(_embed_shard, shards, repeat(model_name)):
+            embeddings.extend(shard_embeddings)
+    return embeddings
+
+async def abuild_rag_chain(llm, data_dir, data_type, batch_docs: int = 64, n_embedders: int = 2):
+    """
+    Async variant of `build_rag_chain` that pipelines ingestion.
+
+    The sequential builder runs load -> embed -> index strictly one after the
+    other, so the disk idles while the embedder works and vice versa. Here the
+    three phases run as concurrent stages connected by bounded queues:
+
+    - stage 1 loads and splits one file at a time (in a thread, the PDF
+      parsing is blocking) and emits batches of `batch_docs` chunks;
+    - stage 2 is `n_embedders` tasks embedding batches as they arrive;
+    - stage 3 is a single writer adding (text, vector) pairs to the FAISS
+      index, seeding it from the first batch.
+
+    Total wall time approaches the slowest phase instead of the sum of all
+    three. Returns (chain, db, embedding): the same semantically-cached RAG
+    chain as the sequential path, plus the FAISS store and the embedder so
+    callers can serve batched retrieval against the same index.
+    """
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
 
-def build_rag_chain(llm, data_dir, data_type):
-    """Build the RAG chain for the question answering API"""
-    doc_loaded = Loader(file_type=data_type).load_dir(data_dir, workers=4)
-    retriever = VectorDB(documents = doc_loaded).get_retriever()
+    loader = Loader(file_type=data_type)
+    embedding = build_default_embedding()
+    # Same on-disk cache as the sequential path: with several uvicorn workers
+    # each booting its own pipeline, only the first ever embeds a given chunk.
+    embed_cache = EmbeddingCache()
+    loaded_q = asyncio.Queue(maxsize=4)
+    embedded_q = asyncio.Queue(maxsize=4)
+    db_holder = {}
+
+    async def load_stage():
+        pending = []
+        for file in loader.list_files(data_dir):
+            pending.extend(await asyncio.to_thread(loader.load, [file], 1))
+            while len(pending) >= batch_docs:
+                await loaded_q.put(pending[:batch_docs])
+                pending = pending[batch_docs:]
+        if pending:
+            await loaded_q.put(pending)
+        for _ in range(n_embedders):
+            await loaded_q.put(None)  # One stop sentinel per embedder.
+
+    async def embed_stage():
+        while True:
+            batch = await loaded_q.get()
+            if batch is None:
+                await embedded_q.put(None)
+                return
+            texts = [doc.page_content for doc in batch]
+            vectors = await asyncio.to_thread(embed_cache.get_or_embed, texts, embedding.embed_documents)
+            await embedded_q.put((batch, vectors))
+
+    async def write_stage():
+        finished = 0
+        while finished < n_embedders:
+            item = await embedded_q.get()
+            if item is None:
+                finished += 1
+                continue
+            batch, vectors = item
+            pairs = list(zip([doc.page_content for doc in batch], vectors))
+            metadatas = [doc.metadata for doc in batch]
+            if "db" not in db_holder:
+                db_holder["db"] = FAISS.from_embeddings(
+                    text_embeddings=pairs,
+                    embedding=embedding,
+                    metadatas=metadatas,
+                    distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+                )
+            else:
+                db_holder["db"].add_embeddings(text_embeddings=pairs, metadatas=metadatas)
+
+    await asyncio.gather(load_stage(),
+                         *[embed_stage() for _ in range(n_embedders)],
+                         write_stage())
+
+    # The pipeline ingests into a flat index; now the corpus size is known,
+    # swap in the IVF-PQ / int8 index like the sequential path does.
+    tune_faiss_index(db_holder["db"])
+    retriever = db_holder["db"].as_retriever(search_type="similarity", search_kwargs={"k": 10})
     rag_chain = RAG_Chain(llm).get_chain(retriever)
-    return rag_chain
+    return CachedChain(rag_chain, SemanticCache(embedding=embedding)), db_holder["db"], embedding
+
+def build_rag_chain(llm, data_dir, data_type, kv_cache_dir=None, parallel_embed=False):
+    """
+    Build the RAG chain for the question answering API.
+
+    If `kv_cache_dir` is given and `llm` is a Hugging Face pipeline, the KV
+    tensors of every chunk are prefilled once here (at ingestion) and persisted,
+    so queries can load them from disk instead of re-running prefill.
+
+    `parallel_embed=True` shards the embedding work across a process pool, one
+    CPU-bound PyTorch embedder per core. Leave it off when the embedder already
+    saturates the machine on its own (GPU, or the multi-threaded ONNX backend).
+
+    The default path streams the corpus in batches: the store is seeded from
+    the first batch and grown with `add_documents`, so peak memory is
+    O(batch) instead of O(corpus). KV precompute and parallel embedding both
+    need the complete document list, so those paths keep the one-shot load.
+    """
+    loader = Loader(file_type=data_type)
+    kv_cache = None
+    if kv_cache_dir is None and not parallel_embed:
+        batches = loader.iter_dir(data_dir, workers=get_num_cpu())
+        # tune_index=False: keep the flat index while streaming, then pick the
+        # compressed index once the real corpus size is known — otherwise the
+        # IVF-PQ gate and the quantizer would only ever see the seed batch.
+        vector_db = VectorDB(documents=next(batches), tune_index=False)
+        for batch in batches:
+            # Cache-aware add: repeat startups over an unchanged corpus stay
+            # O(lookup) for the streamed batches too, not just the seed.
+            vector_db.add_documents(batch)
+        vector_db.tune_index()
+    else:
+        doc_loaded = loader.load_dir(data_dir, workers=get_num_cpu())
+        if kv_cache_dir is not None and hasattr(llm, "pipeline"):
+            kv_cache = KVCacheManager(cache_dir=kv_cache_dir)
+            kv_cache.precompute(doc_loaded, model=llm.pipeline.model, tokenizer=llm.pipeline.tokenizer)
+        embeddings = None
+        if parallel_embed:
+            embeddings = _parallel_embed([doc.page_content for doc in doc_loaded])
+        vector_db = VectorDB(documents = doc_loaded, embeddings = embeddings)
+    retriever = vector_db.get_retriever()
+    # With a KV cache the chain generates through generate_with_cache, so the
+    # precomputed prefills actually get consumed at query time.
+    rag_chain = RAG_Chain(llm).get_chain(retriever, kv_cache=kv_cache)
+    # Semantic cache in front of the chain: repeated and near-duplicate
+    # questions are answered from the cache without any retrieval or LLM work.
+    cache = SemanticCache(embedding=vector_db.embedding)
+    return CachedChain(rag_chain, cache)
@@ -0,0 +1,33 @@
+"""
+This module holds the vendored RAG prompt.
+
+The prompt used to be pulled from the LangChain hub (`rlm/rag-prompt`) inside
+`RAG_Chain.__init__`, which hit the network and re-parsed the template every
+time a chain was built. Vendoring the text here makes chain construction
+instantaneous and offline-safe, and the byte-exact template is what lets the
+prefix cache hit on the shared `instructions + context` block (the question
+placeholder stays strictly last).
+"""
+
+from functools import lru_cache
+from langchain_core.prompts import PromptTemplate
+
+# Same instructions as the `rlm/rag-prompt` hub prompt, with the context first
+# and the question last so repeated retrieval sets form a cacheable prefix.
+RAG_PROMPT_TEMPLATE = (
+    "You are an assistant for question-answering tasks. "
+    "Use the following pieces of retrieved context to answer the question. "
+    "If you don't know the answer, just say that you don't know. "
+    "Use three sentences maximum and keep the answer concise.\n"
+    "Context: {context}\n"
+    "Question: {question}\n"
+    "Answer:"
+)
+
+
+@lru_cache(maxsize=1)
+def get_rag_prompt() -> PromptTemplate:
+    """
+    Return the parsed RAG prompt template, built once per process.
+    """
+    return PromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
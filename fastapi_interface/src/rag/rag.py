@@ -1,7 +1,22 @@
 import re # Used for processing the output of the RAG model and extracting the answer text
-from langchain import hub # Used for loading the RAG prompt
 from langchain_core.runnables import RunnablePassthrough # Used for passing the documents to the RAG model
 from langchain_core.output_parsers import StrOutputParser # Used for parsing the output of the RAG model
+from fastapi_interface.src.rag.prompts import get_rag_prompt # Vendored, process-cached RAG prompt
+
+
+# Compiled once at import time: this parser runs on every generation, so it
+# should hit a precompiled pattern instead of re-entering `re.search` with a
+# string. `re.DOTALL` is used to match any character including newline.
+_ANSWER_RE = re.compile(r"Answer:\s*(.*)", re.DOTALL)
+
+
+def _doc_order(doc):
+    """
+    Deterministic context order for retrieved documents: by (source, page).
+    Shared by the context formatter and the KV-cache path so both agree on
+    which chunk opens the prompt.
+    """
+    return (str(doc.metadata.get("source", "")), doc.metadata.get("page", 0))
 
 
 class Str_OutputParser(StrOutputParser):
@@ -10,13 +25,9 @@ class Str_OutputParser(StrOutputParser):
     """
     def parse(self, text: str) -> str:
         return self._extract_answer(text)
-    
-    def _extract_answer(self,
-                       text_response: str,
-                       pattern: str = r"Answer:\s*(.*)"
-                       ) -> str:
-        match = re.search(pattern, text_response, re.DOTALL)
-        # `re.DOTALL` is used to match any character including newline
+
+    def _extract_answer(self, text_response: str) -> str:
+        match = _ANSWER_RE.search(text_response)
         if match:
             answer_text = match.group(1).strip()
             return answer_text
@@ -59,10 +70,10 @@ class RAG_Chain:
     """
     def __init__(self, llm) -> None:
         self.llm = llm
-        self.prompt = hub.pull("rlm/rag-prompt")
+        self.prompt = get_rag_prompt()
         self.str_parser = Str_OutputParser()
     
-    def get_chain(self, retriever):
+    def get_chain(self, retriever, kv_cache=None):
         """
         This method is used to create a RAG chain.
 
@@ -83,9 +94,14 @@ class RAG_Chain:
             3. Pass the prompt and context to the language model
             4. Extract the answer text from the model output: "Answer: Paris"
         - Output: "Paris"
+
+        When `kv_cache` is given (Hugging Face backend only), generation goes
+        through the KV-cache path instead of the plain `llm` step.
         """
+        if kv_cache is not None:
+            return self._get_kv_chain(retriever, kv_cache)
         input_data = {
-            "context": retriever | self._format_docs, 
+            "context": retriever | self._format_docs,
             "question": RunnablePassthrough()
         }
         rag_chain = (
@@ -96,12 +112,41 @@ class RAG_Chain:
         )
         return rag_chain
 
+    def _get_kv_chain(self, retriever, kv_cache):
+        """
+        Build the chain variant that generates through the KV cache.
+
+        The retrieved documents are kept alongside the question (instead of
+        being collapsed into the formatted context string) so generation can
+        look up the precomputed `past_key_values` of the chunk that opens the
+        prompt and skip re-prefilling the shared prefix.
+        """
+        from langchain_core.runnables import RunnableLambda
+
+        def generate(inputs):
+            docs = sorted(inputs["docs"], key=_doc_order)
+            prompt = self.prompt.format(context=self._format_docs(docs),
+                                        question=inputs["question"])
+            return kv_cache.generate_with_cache(self.llm.pipeline, prompt, docs)
+
+        return (
+            {"docs": retriever, "question": RunnablePassthrough()}
+            | RunnableLambda(generate)
+            | self.str_parser
+        )
+
     def _format_docs(self, docs):
         """
         This method is used to format the documents in the required format.
 
+        The documents are sorted by their (source, page) metadata before being
+        joined. Retrievers may return the same chunks in a different order for
+        near-identical questions; sorting makes the formatted context byte-exact
+        for identical retrieval sets, so the prefix cache can hit on it.
+
         Example:
         - Input: [doc1, doc2, doc3]
         - Output: "doc1\n\ndoc2\n\ndoc3"
         """
-        return "\n\n".join(doc.page_content for doc in docs)
+        sorted_docs = sorted(docs, key=_doc_order)
+        return "\n\n".join(doc.page_content for doc in sorted_docs)
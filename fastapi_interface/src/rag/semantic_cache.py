@@ -0,0 +1,203 @@
+"""
+This module implements a semantic cache in front of the RAG chain.
+
+`/generative_ai` re-runs retrieval, prefill and decode even when the same (or a
+nearly identical) question was just answered. The cache short-circuits that:
+
+1. Exact fast path: the normalized question is hashed with SHA-256 and looked
+   up in a SQLite table — O(1), no embedding work at all.
+2. Semantic path: the question is embedded with the same model `VectorDB`
+   uses, and random-projection LSH buckets narrow the stored queries down to a
+   handful of candidates; if the best candidate's cosine similarity is above
+   the threshold, its cached answer is returned without touching the LLM.
+
+A hit costs well under a millisecond versus a full retrieval + generation.
+"""
+
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.runnables import Runnable
+
+# Anchored next to the other build artifacts (embed_cache.sqlite), not the
+# CWD: uvicorn can be launched from anywhere and the cache must still be found.
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data_src",
+    "semantic_cache.sqlite",
+)
+
+
+def _normalize_query(question: str) -> str:
+    """
+    Normalize a question for the exact-match fast path: lowercase and collapse
+    whitespace, so trivial reformattings of the same question still hit.
+    """
+    return re.sub(r"\s+", " ", question.strip().lower())
+
+
+class SemanticCache:
+    """
+    This class caches answers keyed by query embedding, using LSH for lookup.
+
+    Args:
+    embedding: The embedding model (same one used by VectorDB).
+    db_path: str
+        The SQLite file the cache is persisted to.
+    threshold: float
+        The minimum cosine similarity for a semantic hit.
+    n_tables: int
+        The number of independent LSH tables (more tables, higher recall).
+    n_bits: int
+        The number of random hyperplanes per table (more bits, smaller buckets).
+    """
+    def __init__(self,
+                 embedding,
+                 db_path: str = DEFAULT_CACHE_PATH,
+                 threshold: float = 0.95,
+                 n_tables: int = 8,
+                 n_bits: int = 16,
+                 ) -> None:
+        self.embedding = embedding
+        self.threshold = threshold
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self._planes = None  # Built lazily: the embedding dimension is unknown until the first vector.
+        self._tables: List[dict] = [{} for _ in range(n_tables)]
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # One shared connection hit by concurrent requests: statements (and
+        # the in-memory LSH tables they update) must be serialized.
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, question TEXT, vec BLOB, answer TEXT)"
+        )
+        self._conn.commit()
+        # Rebuild the in-memory LSH tables from whatever survived on disk.
+        for key, blob in self._conn.execute("SELECT key, vec FROM query_cache"):
+            self._index(key, np.frombuffer(blob, dtype=np.float32))
+
+    def _ensure_planes(self, dim: int):
+        if self._planes is None:
+            # A fixed seed keeps bucket assignments stable across restarts,
+            # otherwise the persisted entries would land in different buckets.
+            rng = np.random.default_rng(0)
+            self._planes = rng.standard_normal((self.n_tables, self.n_bits, dim)).astype(np.float32)
+
+    def _signatures(self, vec: np.ndarray) -> List[int]:
+        """
+        Compute the LSH bucket signature of a vector in each table: the sign
+        pattern of the vector against each table's random hyperplanes.
+        """
+        self._ensure_planes(vec.shape[0])
+        signatures = []
+        for t in range(self.n_tables):
+            bits = (self._planes[t] @ vec) > 0
+            signatures.append(int(np.packbits(bits).tobytes().hex(), 16))
+        return signatures
+
+    def _index(self, key: str, vec: np.ndarray):
+        for table, signature in zip(self._tables, self._signatures(vec)):
+            table.setdefault(signature, []).append(key)
+
+    def _embed(self, question: str) -> np.ndarray:
+        vec = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def get(self, question: str) -> Optional[str]:
+        """
+        Return the cached answer for a question, or None on a miss.
+        """
+        key = hashlib.sha256(_normalize_query(question).encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._conn.execute("SELECT answer FROM query_cache WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return row[0]
+
+        # Exact miss: fall back to the LSH tables over query embeddings.
+        # Embedding happens outside the lock; only the table/connection reads
+        # are serialized.
+        vec = self._embed(question)
+        rows = []
+        with self._lock:
+            candidates = set()
+            for table, signature in zip(self._tables, self._signatures(vec)):
+                candidates.update(table.get(signature, ()))
+            for candidate_key in candidates:
+                cand = self._conn.execute(
+                    "SELECT vec, answer FROM query_cache WHERE key = ?", (candidate_key,)
+                ).fetchone()
+                if cand is not None:
+                    rows.append(cand)
+        best_answer, best_score = None, self.threshold
+        for blob, answer in rows:
+            score = float(np.dot(vec, np.frombuffer(blob, dtype=np.float32)))
+            if score >= best_score:
+                best_answer, best_score = answer, score
+        return best_answer
+
+    def set(self, question: str, answer: str):
+        """
+        Store an answer under both the exact key and the LSH tables.
+        """
+        key = hashlib.sha256(_normalize_query(question).encode("utf-8")).hexdigest()
+        vec = self._embed(question)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache (key, question, vec, answer) VALUES (?, ?, ?, ?)",
+                (key, question, vec.tobytes(), answer),
+            )
+            self._conn.commit()
+            self._index(key, vec)
+
+
+class CachedChain(Runnable[str, str]):
+    """
+    This class wraps the RAG chain with the semantic cache.
+
+    Parameterizing `Runnable[str, str]` keeps langserve's schema inference
+    working on the wrapped chain's routes (an unparameterized Runnable would
+    degrade the playground's input/output schemas to bare TypeVars).
+
+    On `invoke`/`ainvoke` it first consults the cache; only on a miss does it
+    run the underlying chain, and the fresh answer is stored for next time.
+    """
+    def __init__(self, chain, cache: SemanticCache) -> None:
+        self.chain = chain
+        self.cache = cache
+
+    def invoke(self, input, config=None, **kwargs):
+        cached = self.cache.get(input)
+        if cached is not None:
+            return cached
+        answer = self.chain.invoke(input, config=config, **kwargs)
+        self.cache.set(input, answer)
+        return answer
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        cached = self.cache.get(input)
+        if cached is not None:
+            return cached
+        answer = await self.chain.ainvoke(input, config=config, **kwargs)
+        self.cache.set(input, answer)
+        return answer
+
+    async def astream(self, input, config=None, **kwargs):
+        # On a hit the full cached answer is yielded as a single chunk; on a
+        # miss the underlying chain's tokens are forwarded as they arrive and
+        # the assembled answer is cached once the stream completes.
+        cached = self.cache.get(input)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for chunk in self.chain.astream(input, config=config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self.cache.set(input, "".join(chunks))
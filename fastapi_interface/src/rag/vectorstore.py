@@ -1,7 +1,290 @@
-from typing import Union
-from langchain_chroma import Chroma
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+import os
+import math
+from typing import TYPE_CHECKING, Union
+from fastapi_interface.src.rag.embed_cache import EmbeddingCache, DEFAULT_CACHE_PATH
+
+if TYPE_CHECKING:
+    # Heavy imports are deferred to use sites: langchain_chroma, FAISS and
+    # langchain_huggingface transitively pull in torch, transformers, chromadb
+    # and friends, which costs multiple seconds of cold start per worker when
+    # imported eagerly at module load.
+    from langchain_chroma import Chroma
+    from langchain_community.vectorstores import FAISS
+
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _fused_meanpool_norm():
+    """
+    Build (and JIT-compile once) the fused mean-pool + L2-normalize kernel.
+
+    The NumPy pooling path makes three full passes over the (B, T, D) hidden
+    states — masked sum, divide, normalize — each materializing a temporary.
+    The Numba kernel does all three in one cache-resident sweep per row;
+    fastmath allows the reduction to reassociate so the inner loop vectorizes
+    to FMA instructions, and prange spreads rows across cores. Returns None
+    when numba is not installed so callers can keep the NumPy path.
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+    import numpy as np
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def kernel(hidden, mask, out):  # (B, T, D), (B, T) -> (B, D)
+        n_batch, n_tokens, n_dim = hidden.shape
+        for b in numba.prange(n_batch):
+            count = 0.0
+            for t in range(n_tokens):
+                count += mask[b, t]
+            if count == 0.0:
+                count = 1.0
+            sq_norm = 0.0
+            for d in range(n_dim):
+                acc = 0.0
+                for t in range(n_tokens):
+                    acc += hidden[b, t, d] * mask[b, t]
+                acc /= count
+                out[b, d] = acc
+                sq_norm += acc * acc
+            inv_norm = 1.0 / np.sqrt(sq_norm) if sq_norm > 0.0 else 1.0
+            for d in range(n_dim):
+                out[b, d] *= inv_norm
+
+    return kernel
+
+
+class ONNXEmbeddings:
+    """
+    This class adapts an ONNX Runtime feature-extraction model to the
+    LangChain embeddings interface (`embed_documents` / `embed_query`).
+    """
+    def __init__(self, model, tokenizer) -> None:
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def embed_documents(self, texts):
+        import numpy as np
+        encoded = self.tokenizer(texts, padding=True, truncation=True, return_tensors="np")
+        outputs = self.model(**encoded)
+        kernel = _fused_meanpool_norm()
+        if kernel is not None:
+            hidden = np.ascontiguousarray(outputs.last_hidden_state, dtype=np.float32)
+            mask = np.ascontiguousarray(encoded["attention_mask"], dtype=np.float32)
+            pooled = np.empty((hidden.shape[0], hidden.shape[2]), dtype=np.float32)
+            kernel(hidden, mask, pooled)
+            return pooled.tolist()
+        # Mean-pool the token states under the attention mask, then L2-normalize.
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        summed = (outputs.last_hidden_state * mask).sum(axis=1)
+        pooled = summed / mask.sum(axis=1)
+        pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# Single source of truth for the embedding model: ingestion (including the
+# process-pool shard workers) and query time must agree on it, or the FAISS
+# index dimension and the content-hash cache rows stop matching.
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def build_default_embedding(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    Build the default embedder: an INT8 dynamically-quantized ONNX Runtime
+    export of the MiniLM sentence-transformer.
+
+    The stock `HuggingFaceEmbeddings()` runs the unoptimized PyTorch model on
+    CPU, which is the compute-bound hot path at both index build and query
+    time. On a CUDA host the same model runs in FP16 on the GPU with large
+    batches — 30-50x faster than FP32 CPU — so that wins outright. On
+    CPU-only hosts the quantized ONNX export halves the bytes moved through
+    attention and uses int8 VNNI kernels, typically 3-4x faster on the same
+    cores. If optimum/onnxruntime are not installed we fall back to the
+    PyTorch model.
+    """
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    if torch.cuda.is_available():
+        # TF32 matmuls are a free speedup for any FP32 ops left in the stack.
+        torch.backends.cuda.matmul.allow_tf32 = True
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": "cuda", "model_kwargs": {"torch_dtype": torch.float16}},
+            # Batch 256 keeps the GPU fed; normalized vectors let retrieval
+            # use plain inner products for cosine.
+            encode_kwargs={"batch_size": 256, "normalize_embeddings": True},
+        )
+
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError:
+        return HuggingFaceEmbeddings(model_name=model_name,
+                                     encode_kwargs={"normalize_embeddings": True})
+
+    import shutil
+    import tempfile
+    from transformers import AutoTokenizer
+
+    # Persist the quantized export next to the other build artifacts
+    # (embed_cache.sqlite, ivfpq.index). Export + INT8 quantization takes tens
+    # of seconds, and a fresh temp dir per call meant every uvicorn worker
+    # re-did it at startup and leaked the directory. Quantize into a temp
+    # sibling and promote it with an atomic rename, so racing workers either
+    # win the rename or reuse the winner's export — never a half-written one.
+    cache_dir = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH),
+                             "onnx_embeddings",
+                             model_name.replace("/", "--"))
+    if not os.path.isdir(cache_dir):
+        model = ORTModelForFeatureExtraction.from_pretrained(
+            model_name, export=True, provider="CPUExecutionProvider"
+        )
+        quantizer = ORTQuantizer.from_pretrained(model)
+        os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".export_", dir=os.path.dirname(cache_dir))
+        quantizer.quantize(
+            save_dir=tmp_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False),
+        )
+        try:
+            os.rename(tmp_dir, cache_dir)
+        except OSError:
+            # Another worker finished its export first; use that one.
+            shutil.rmtree(tmp_dir)
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = os.cpu_count()
+    quantized = ORTModelForFeatureExtraction.from_pretrained(
+        cache_dir, provider="CPUExecutionProvider", session_options=session_options
+    )
+    return ONNXEmbeddings(quantized, AutoTokenizer.from_pretrained(model_name))
+
+
+def batch_search(db, embedding, queries, k: int = 10):
+    """
+    Run several queries against a FAISS store as one matrix search.
+
+    k sequential single-vector scans are each memory-bandwidth-bound; packing
+    the query embeddings into one (m, d) matrix turns retrieval into a single
+    BLAS-3-shaped operation that reuses the index's cache lines across all
+    queries. Returns one list of Documents per query.
+    """
+    import numpy as np
+
+    xq = np.asarray(embedding.embed_documents(queries), dtype=np.float32)
+    _, indices = db.index.search(xq, k)
+    results = []
+    for row in indices:
+        docs = []
+        for idx in row:
+            if idx == -1:
+                continue  # FAISS pads short result lists with -1.
+            docs.append(db.docstore.search(db.index_to_docstore_id[int(idx)]))
+        results.append(docs)
+    return results
+
+
+# Below this corpus size a flat FAISS index is kept: brute force is already
+# fast there and IVF-PQ training needs enough vectors to be meaningful.
+_IVF_PQ_MIN_DOCS = 5000
+
+def _swap_in_ivfpq_index(db, embeddings, persist_directory: str = None, nprobe: int = 16):
+    """
+    Replace the flat FAISS index with a trained IVF-PQ index.
+
+    A flat index brute-force scans every FP32 vector per query; IVF prunes
+    the search to a few Voronoi cells and PQ scans them with int8 table
+    lookups, which is 10-50x faster at high recall once the corpus is
+    large. Vectors are re-added in the same order, so the wrapper's
+    docstore id mapping stays valid. The trained index is persisted when a
+    persist_directory is given, so later startups skip training.
+    """
+    import faiss
+    import numpy as np
+
+    xb = np.asarray(embeddings, dtype=np.float32)
+    d = xb.shape[1]
+    index_path = (os.path.join(persist_directory, "ivfpq.index")
+                  if persist_directory else None)
+    index = None
+    if index_path and os.path.exists(index_path):
+        # The persisted file only short-circuits training (coarse centroids
+        # and PQ codebooks): any vectors stored in it belong to whatever
+        # corpus existed when it was written, while the caller's docstore is
+        # built from the current documents. Drop them and re-add the current
+        # vectors so index ids and docstore ids stay aligned.
+        cached = faiss.read_index(index_path)
+        if cached.d == d and cached.is_trained:
+            cached.reset()
+            index = cached
+    if index is None:
+        nlist = int(4 * math.sqrt(len(xb)))
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(quantizer, d, nlist, max(1, d // 4), 8, faiss.METRIC_INNER_PRODUCT)
+        index.train(xb)
+        if index_path:
+            # Persist the trained-but-empty index: smaller on disk, and the
+            # stored vectors would be discarded on reload anyway.
+            os.makedirs(persist_directory, exist_ok=True)
+            faiss.write_index(index, index_path)
+    index.add(xb)
+    index.nprobe = nprobe
+    db.index = index
+
+
+def _swap_in_sq8_index(db, embeddings):
+    """
+    Replace the flat FP32 FAISS index with an int8 scalar-quantized one.
+
+    Retrieval over a flat index is memory-bandwidth-bound; QT_8bit stores
+    each component in one byte instead of four, so a query moves 4x fewer
+    bytes and the distance kernels run on int8 SIMD, for a recall loss
+    that is typically under 1%. Used for corpora below the IVF-PQ
+    threshold; re-adding in the same order keeps the docstore ids valid.
+    """
+    import faiss
+    import numpy as np
+
+    xb = np.asarray(embeddings, dtype=np.float32)
+    index = faiss.IndexScalarQuantizer(xb.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    index.train(xb)
+    index.add(xb)
+    db.index = index
+
+
+def tune_faiss_index(db, persist_directory: str = None, nprobe: int = 16):
+    """
+    Swap a finished flat FAISS index for the size-appropriate compressed one.
+
+    The builders ingest into a flat FP32 index (cheap incremental adds, exact
+    vectors); once the corpus size is known this reads the vectors back out of
+    the flat index and replaces it with IVF-PQ above `_IVF_PQ_MIN_DOCS`
+    vectors or an int8 scalar-quantized index below. Must be called while the
+    index is still flat — reconstruction from a quantized index is lossy.
+    """
+    index = db.index
+    xb = index.reconstruct_n(0, index.ntotal)
+    if index.ntotal > _IVF_PQ_MIN_DOCS:
+        _swap_in_ivfpq_index(db, xb, persist_directory=persist_directory, nprobe=nprobe)
+    else:
+        _swap_in_sq8_index(db, xb)
+
+
+# HNSW parameters for the Chroma collection: an ANN graph query is O(log N)
+# versus the O(N) brute-force scan, which is what keeps k=10 retrieval fast
+# once the corpus grows past a few thousand chunks. Higher construction_ef/M
+# trade index-build time for recall.
+_HNSW_SETTINGS = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+}
 
 class VectorDB:
     """
@@ -9,23 +292,222 @@ class VectorDB:
     """
     def __init__(self,
                  documents = None,
-                 vector_db: Union[Chroma, FAISS] = Chroma,
-                 embedding = HuggingFaceEmbeddings(),
+                 vector_db: Union["Chroma", "FAISS"] = None,
+                 embedding = None,
+                 embed_cache_path: str = None,
+                 persist_directory: str = None,
+                 embeddings = None,
+                 tune_index: bool = True,
                  ) -> None:
+        if vector_db is None:
+            from langchain_community.vectorstores import FAISS
+            vector_db = FAISS
         self.vector_db = vector_db
-        self.embedding = embedding
-        self.db = self._build_db(documents)
+        # Built lazily so callers that pass their own embedder never pay the
+        # default model's export/load cost.
+        self.embedding = embedding if embedding is not None else build_default_embedding()
+        self.persist_directory = persist_directory
+        # Content-hash cache so unchanged chunks are never re-embedded across ingests.
+        self.embed_cache = EmbeddingCache(embed_cache_path) if embed_cache_path else EmbeddingCache()
+        # Built retrievers keyed by their settings, so repeated get_retriever
+        # calls don't reconstruct (and pydantic-validate) the wrapper object.
+        self._retriever_cache: dict = {}
+        # tune_index=False keeps the flat FP32 index so streaming callers can
+        # keep adding documents; they call tune_index() once ingestion is done.
+        self._tune_index = tune_index
+        self.db = self._build_db(documents, embeddings=embeddings)
 
-    def _build_db(self, documents):
+    def _build_db(self, documents, embeddings = None, batch_size: int = 256):
         """
         This function builds the vector database.
+
+        The chunks are embedded once, in large batches, and the precomputed
+        vectors are handed to the store via `from_embeddings`. This keeps the
+        embedding model fed with full batches (the bandwidth bottleneck of
+        indexing) and avoids the store re-tokenizing/re-embedding internally
+        one document at a time.
         """
-        db = self.vector_db.from_documents(documents=documents, embedding=self.embedding)
+        if hasattr(self.vector_db, "from_embeddings"):
+            texts = [doc.page_content for doc in documents]
+            metadatas = [doc.metadata for doc in documents]
+            if embeddings is None:
+                # Prefer encoding straight into one preallocated (N, d)
+                # float32 matrix; fall back to the cached list path when the
+                # embedder doesn't expose a sentence-transformers client.
+                embeddings = self._embed_into_buffer(texts, batch_size=batch_size)
+                if embeddings is None:
+                    embeddings = self._embed_texts(texts, batch_size=batch_size)
+            else:
+                # Precomputed vectors (parallel-embed path): backfill the
+                # content-hash cache so the next ingest of these chunks hits.
+                self.embed_cache.put(texts, embeddings)
+            from langchain_community.vectorstores import FAISS
+            from langchain_community.vectorstores.utils import DistanceStrategy
+            if self.vector_db is FAISS:
+                import faiss
+                import numpy as np
+                # Normalize once at index time and search with pure inner
+                # products: cosine similarity then needs no denominator or
+                # sqrt per comparison, just a fused multiply-add reduction.
+                # Query vectors are normalized by the embedder to match.
+                # asarray is a no-op for the preallocated-buffer path, so the
+                # matrix flows into FAISS without another copy.
+                xb = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+                faiss.normalize_L2(xb)
+                db = self.vector_db.from_embeddings(
+                    text_embeddings=list(zip(texts, xb)),
+                    embedding=self.embedding,
+                    metadatas=metadatas,
+                    distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+                )
+                if self._tune_index:
+                    if len(texts) > _IVF_PQ_MIN_DOCS:
+                        _swap_in_ivfpq_index(db, xb, persist_directory=self.persist_directory)
+                    else:
+                        _swap_in_sq8_index(db, xb)
+            else:
+                db = self.vector_db.from_embeddings(
+                    text_embeddings=list(zip(texts, embeddings)),
+                    embedding=self.embedding,
+                    metadatas=metadatas,
+                )
+        else:
+            # Stores without a precomputed-embeddings entry point (e.g. Chroma)
+            # keep the single-call ingestion, but with the HNSW settings above
+            # so retrieval runs against an ANN graph instead of a flat scan.
+            if self.persist_directory and os.path.isdir(self.persist_directory) and os.listdir(self.persist_directory):
+                # A persisted index exists on disk: load it instead of
+                # re-embedding and rebuilding the whole collection.
+                db = self.vector_db(
+                    persist_directory=self.persist_directory,
+                    embedding_function=self.embedding,
+                    collection_metadata=_HNSW_SETTINGS,
+                )
+            else:
+                db = self.vector_db.from_documents(
+                    documents=documents,
+                    embedding=self.embedding,
+                    persist_directory=self.persist_directory,
+                    collection_metadata=_HNSW_SETTINGS,
+                )
         return db
 
-    def get_retriever(self, search_type: str = "similarity", search_kwargs: dict = {"k": 10}):
+    def _embed_into_buffer(self, texts, batch_size: int = 256):
+        """
+        This function embeds all texts directly into one preallocated,
+        contiguous (N, d) float32 matrix.
+
+        `embed_documents` returns a list of Python lists that the FAISS
+        wrapper then converts back to an ndarray — O(N) list objects and a
+        full extra copy. Encoding batch slices straight into the row-major
+        buffer skips both, and the contiguous layout is exactly what FAISS
+        `add`/`train` want. Returns None when the embedder doesn't expose a
+        sentence-transformers client (the ONNX adapter, custom embedders),
+        in which case the caller falls back to `_embed_texts`. The content
+        hash cache is consulted first — cached rows are copied into the
+        buffer and only the misses are encoded (and written back), so a
+        repeated ingest of an unchanged corpus skips the model entirely.
+        """
+        client = getattr(self.embedding, "client", None)
+        if client is None or not hasattr(client, "get_sentence_embedding_dimension"):
+            return None
+        import numpy as np
+
+        xb = np.empty((len(texts), client.get_sentence_embedding_dimension()), dtype=np.float32)
+        cached = self.embed_cache.lookup(texts)
+        misses = []
+        for i, vec in enumerate(cached):
+            # A wrong-width row means the cache entry was written by a
+            # different embedding model; treat it as a miss and overwrite it.
+            if vec is None or vec.shape[0] != xb.shape[1]:
+                misses.append(i)
+            else:
+                xb[i] = vec
+        for start in range(0, len(misses), batch_size):
+            batch = misses[start:start + batch_size]
+            xb[batch] = client.encode(
+                [texts[i] for i in batch],
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        if misses:
+            self.embed_cache.put([texts[i] for i in misses], xb[misses])
+        return xb
+
+    def _embed_texts(self, texts, batch_size: int = 256):
+        """
+        This function embeds all texts in batches of `batch_size`, going
+        through the on-disk cache so only never-seen chunks hit the model.
+        """
+        def embed_batched(batch_texts):
+            # Smart (length-bucketed) batching: each mini-batch is padded to
+            # its longest member, so embedding texts of wildly different
+            # lengths together wastes most of the FLOPs on padding tokens.
+            # Sorting by length first makes every batch near-uniform, and the
+            # vectors are scattered back to the original order afterwards.
+            # Character length is a close, free proxy for token length here.
+            order = sorted(range(len(batch_texts)), key=lambda i: len(batch_texts[i]))
+            embeddings = [None] * len(batch_texts)
+            for start in range(0, len(order), batch_size):
+                bucket = order[start:start + batch_size]
+                vectors = self.embedding.embed_documents([batch_texts[i] for i in bucket])
+                for i, vector in zip(bucket, vectors):
+                    embeddings[i] = vector
+            return embeddings
+
+        return self.embed_cache.get_or_embed(texts, embed_batched)
+
+    def add_documents(self, documents):
+        """
+        This function adds documents to an existing store, embedding them
+        through the content-hash cache. The store's own `add_documents` calls
+        `embed_documents` directly, which would re-embed every batch of a
+        streaming ingest on every startup; going through `_embed_texts` keeps
+        repeated startups at O(lookup) like the initial build.
+        """
+        if hasattr(self.db, "add_embeddings"):
+            texts = [doc.page_content for doc in documents]
+            vectors = self._embed_texts(texts)
+            self.db.add_embeddings(text_embeddings=list(zip(texts, vectors)),
+                                   metadatas=[doc.metadata for doc in documents])
+        else:
+            # Stores without a precomputed-embeddings entry point (Chroma).
+            self.db.add_documents(documents)
+
+    def tune_index(self):
+        """
+        This function swaps in the size-appropriate compressed index once a
+        streaming ingest (construction with `tune_index=False` followed by
+        `db.add_documents` calls) is complete. The IVF-PQ vs int8 gate then
+        sees the real corpus size instead of the seed batch's. No-op for
+        stores without a FAISS index.
+        """
+        if hasattr(self.db, "index"):
+            tune_faiss_index(self.db, persist_directory=self.persist_directory)
+
+    def get_retriever(self, search_type: str = "similarity", search_kwargs: dict = None):
         """
         This function returns a retriever object.
         """
-        retriever = self.db.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+        # None sentinel instead of a mutable default dict: the shared default
+        # could be mutated by one caller and leak into every later call.
+        if search_kwargs is None:
+            search_kwargs = {"k": 10}
+        key = (search_type, tuple(sorted(search_kwargs.items())))
+        retriever = self._retriever_cache.get(key)
+        if retriever is None:
+            retriever = self.db.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+            self._retriever_cache[key] = retriever
         return retriever
+
+    def batch_retrieve(self, queries, k: int = 10):
+        """
+        This function retrieves documents for several queries at once.
+
+        FAISS stores take the single-matrix search path; other backends fall
+        back to the retriever's own batch implementation.
+        """
+        if hasattr(self.db, "index"):
+            return batch_search(self.db, self.embedding, queries, k=k)
+        return self.get_retriever(search_kwargs={"k": k}).batch(queries)
@@ -0,0 +1,16 @@
+#!/usr/bin/env bash
+# Serve the API with one uvicorn worker per CPU so independent requests can
+# overlap. Generation itself is async (vLLM continuous batching), but multiple
+# workers also parallelize request parsing, retrieval and history I/O.
+# Override WEB_CONCURRENCY to pin the worker count (e.g. WEB_CONCURRENCY=1 on
+# a single-GPU host if each worker loads its own model).
+set -euo pipefail
+
+export WEB_CONCURRENCY="${WEB_CONCURRENCY:-$(nproc)}"
+
+exec uvicorn fastapi_interface.app:app \
+    --host 0.0.0.0 \
+    --port 8000 \
+    --workers "$WEB_CONCURRENCY" \
+    --loop uvloop \
+    --http httptools